@@ -10,242 +10,920 @@ by updating data deletion policies and retrying operations.
 import boto3
 import time
 import sys
-from botocore.exceptions import ClientError, NoCredentialsError
-from typing import List, Dict, Any
+from botocore.config import Config
+from botocore.exceptions import (
+    ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError,
+    NoCredentialsError, ReadTimeoutError
+)
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 import argparse
+import asyncio
+import importlib.util
 import json
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+from logging.handlers import QueueHandler, QueueListener
+from urllib3.exceptions import NewConnectionError, ProtocolError
+
+try:
+    import orjson
+    
+    def _dumps(obj: Dict[str, Any]) -> str:
+        return orjson.dumps(obj).decode()
+except ImportError:
+    def _dumps(obj: Dict[str, Any]) -> str:
+        return json.dumps(obj)
+
+log = logging.getLogger('kbcleaner')
+
+# Worker threads only enqueue records; one listener thread writes them out
+_log_queue = queue.Queue()
+
+def setup_logging(stream=None) -> QueueListener:
+    """Send kbcleaner logs through a queue drained to stream (default stdout) by a single thread"""
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    
+    log.addHandler(QueueHandler(_log_queue))
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    
+    listener = QueueListener(_log_queue, handler)
+    listener.start()
+    return listener
+
+def flush_logs() -> None:
+    """Block until every queued log record has been written"""
+    _log_queue.join()
+
+# Largest maxResults accepted by the bedrock-agent list APIs
+PAGE_SIZE = 1000
+
+# Concurrent data source deletes per Knowledge Base
+MAX_DS_WORKERS = 8
+
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'TooManyRequestsException'}
+
+STALE_CONNECTION_ERRORS = (
+    ConnectionClosedError, ReadTimeoutError, EndpointConnectionError, ConnectTimeoutError,
+    ProtocolError, NewConnectionError
+)
+
+def is_stale_connection_error(exc: BaseException) -> bool:
+    """Return True if exc means the pooled HTTPS connection is dead"""
+    if isinstance(exc, STALE_CONNECTION_ERRORS):
+        return True
+    
+    # urllib3/botocore occasionally trip internal assertions on a dead socket
+    if isinstance(exc, AssertionError) and exc.__traceback__ is not None:
+        tb = exc.__traceback__
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        module = tb.tb_frame.f_globals.get('__name__', '')
+        return module.startswith(('urllib3.', 'botocore.', 'boto3.'))
+    
+    return False
+
+class RateLimiter:
+    """Thread-safe token bucket allowing rate acquisitions per second"""
+    
+    def __init__(self, rate: float):
+        if rate <= 0:
+            raise ValueError(f"rate must be greater than 0, got {rate}")
+        self.rate = rate
+        self.allowance = rate
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _reserve(self) -> float:
+        """Take one token and return how long to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate)
+            self.last = now
+            
+            if self.allowance >= 1:
+                self.allowance -= 1
+                return 0.0
+            
+            # Reserve the next token so concurrent callers queue up behind us
+            wait_s = (1 - self.allowance) / self.rate
+            self.allowance -= 1
+            return wait_s
+    
+    def acquire(self) -> None:
+        """Take one token, sleeping only when the bucket is empty"""
+        wait_s = self._reserve()
+        if wait_s:
+            time.sleep(wait_s)
+    
+    async def aacquire(self) -> None:
+        """Take one token without blocking the event loop"""
+        wait_s = self._reserve()
+        if wait_s:
+            await asyncio.sleep(wait_s)
 
 class BedrockKBCleaner:
-    def __init__(self, region='us-east-1', dry_run=False):
+    def __init__(self, region='us-east-1', dry_run=False, batch_size=4, fast_retain=False,
+                 use_async=False, json_output=False, max_tps=4.0,
+                 boto3_session: Optional[boto3.Session] = None, bedrock_client=None):
         """
         Initialize the Bedrock KB cleaner
         
         Args:
             region: AWS region to operate in
             dry_run: If True, only list KBs without deleting
+            batch_size: Number of Knowledge Bases to delete concurrently
+            fast_retain: If True, set every data source to RETAIN before deleting it
+            use_async: If True, delete with aioboto3 on an asyncio event loop
+            json_output: If True, write one JSON object per deletion event to stdout
+            max_tps: DeleteKnowledgeBase calls allowed per second across all workers
+            boto3_session: Session to build the bedrock-agent client from, e.g. one
+                with a named profile (default: a new session for region); its
+                region, if set, overrides region
+            bedrock_client: Pre-built bedrock-agent client to use as-is (not supported
+                with use_async, which needs its own aioboto3 client)
         """
-        self.region = region
+        if use_async and bedrock_client is not None:
+            raise ValueError("use_async builds its own aioboto3 client and cannot use an injected bedrock_client")
+        
+        # An injected client or session decides the region, so logs and clients agree with it
+        if bedrock_client is not None:
+            self.region = bedrock_client.meta.region_name
+        else:
+            self.region = (boto3_session.region_name if boto3_session else None) or region
         self.dry_run = dry_run
+        self.batch_size = max(1, batch_size)
+        self.fast_retain = fast_retain
+        self.use_async = use_async
+        self.json_output = json_output
+        self._emit_lock = threading.Lock()
+        self.rl = RateLimiter(rate=max_tps)
+        
+        if use_async:
+            # Only probed here; aioboto3 pulls in aiohttp, which the default path never needs,
+            # so it is imported in _adelete_all
+            if importlib.util.find_spec('aioboto3') is None:
+                log.error("❌ --use-async requires aioboto3. Install it with: pip install aioboto3")
+                sys.exit(1)
+        
+        self._client_lock = threading.Lock()
+        
+        # Throttled responses seen since the dispatcher last checked, including
+        # ones botocore went on to retry successfully
+        self._throttle_count = 0
+        self._throttle_lock = threading.Lock()
+        
+        # GetDataSource snapshots keyed by (kb_id, data_source_id)
+        self._ds_cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        
+        # Timeouts live in the client config so they work from any thread, and
+        # the pool is sized so concurrent workers don't discard connections: each
+        # KB worker fans out to up to MAX_DS_WORKERS data source deletes
+        self._client_config = Config(
+            connect_timeout=10,
+            read_timeout=45,
+            retries={'max_attempts': 8, 'mode': 'adaptive'},
+            max_pool_connections=self.batch_size * MAX_DS_WORKERS + 10
+        )
+        
+        # Only clients built here are rebuilt after stale-connection errors
+        self._owns_client = bedrock_client is None
         
         try:
-            self.bedrock_client = boto3.client('bedrock-agent', region_name=region)
+            # One session and one client, shared by all worker threads; an injected
+            # client needs no session of its own
+            if bedrock_client is not None:
+                self.session = boto3_session
+                self.bedrock_client = self._watch_throttling(bedrock_client)
+            else:
+                self.session = boto3_session or boto3.Session(region_name=self.region)
+                self.bedrock_client = self._build_client()
         except NoCredentialsError:
-            print("❌ AWS credentials not found. Please configure your AWS credentials.")
-            print("You can use: aws configure, environment variables, or IAM roles")
+            log.error("❌ AWS credentials not found. Please configure your AWS credentials.")
+            log.error("You can use: aws configure, environment variables, or IAM roles")
             sys.exit(1)
     
-    def list_knowledge_bases(self) -> List[Dict[str, Any]]:
-        """List all knowledge bases in the account"""
+    def _emit(self, event: Dict[str, Any]) -> None:
+        """Write a deletion event as a single JSON line when JSON output is enabled"""
+        if not self.json_output:
+            return
+        
+        line = _dumps(event) + "\n"
+        with self._emit_lock:
+            sys.stdout.write(line)
+            sys.stdout.flush()
+    
+    def _emit_kb(self, kb_id: str, kb_name: str, start: float, error: Optional[str] = None) -> None:
+        """Emit the outcome of one knowledge base deletion"""
+        event = {'event': 'kb_delete_ok' if error is None else 'kb_delete_failed', 'kb_id': kb_id, 'kb_name': kb_name,
+                 'elapsed_s': round(time.monotonic() - start, 3)}
+        if error is not None:
+            event['error'] = error
+        self._emit(event)
+    
+    def _emit_ds(self, kb_id: str, data_source_id: str, error: Optional[str] = None) -> None:
+        """Emit the outcome of one data source deletion"""
+        event = {'event': 'ds_delete_ok' if error is None else 'ds_delete_failed', 'kb_id': kb_id,
+                 'data_source_id': data_source_id}
+        if error is not None:
+            event['error'] = error
+        self._emit(event)
+    
+    def _build_client(self):
+        """Create a bedrock-agent client from the shared session"""
+        client = self.session.client('bedrock-agent', region_name=self.region, config=self._client_config)
+        return self._watch_throttling(client)
+    
+    def _watch_throttling(self, client):
+        """Count every throttled response on client, before botocore decides whether to retry it"""
+        client.meta.events.register('needs-retry.bedrock-agent', self._count_throttle)
+        return client
+    
+    def _count_throttle(self, response=None, **kwargs) -> None:
+        # Returning None leaves the retry decision to botocore's own handler
+        if response is not None and response[1].get('Error', {}).get('Code') in THROTTLING_ERROR_CODES:
+            with self._throttle_lock:
+                self._throttle_count += 1
+    
+    def _call(self, operation: str, **kwargs) -> Dict[str, Any]:
+        """Invoke a bedrock-agent operation, rebuilding the client once if its connection went stale"""
+        client = self.bedrock_client
+        
         try:
-            print(f"🔍 Listing Knowledge Bases in region {self.region}...")
-            
-            knowledge_bases = []
-            paginator = self.bedrock_client.get_paginator('list_knowledge_bases')
+            return getattr(client, operation)(**kwargs)
+        except Exception as e:
+            if not self._owns_client or not is_stale_connection_error(e):
+                raise
             
-            for page in paginator.paginate():
-                knowledge_bases.extend(page.get('knowledgeBaseSummaries', []))
+            with self._client_lock:
+                # Another worker may already have replaced the client
+                if self.bedrock_client is client:
+                    log.warning(f"    ⚠️  Stale connection ({type(e).__name__}), rebuilding client...")
+                    self.bedrock_client = self._build_client()
             
-            print(f"📊 Found {len(knowledge_bases)} Knowledge Bases")
-            
-            for i, kb in enumerate(knowledge_bases, 1):
-                print(f"  {i}. {kb['name']} (ID: {kb['knowledgeBaseId']}) - Status: {kb['status']}")
-            
-            return knowledge_bases
+            return getattr(self.bedrock_client, operation)(**kwargs)
+    
+    def iter_knowledge_bases(self) -> Iterator[Dict[str, Any]]:
+        """Yield knowledge base summaries page by page as they arrive"""
+        kwargs = {'maxResults': PAGE_SIZE}
+        
+        try:
+            # Paginate by hand so each page goes through the stale-connection retry;
+            # in streaming mode this runs on the dispatcher for the whole run
+            while True:
+                page = self._call('list_knowledge_bases', **kwargs)
+                yield from page.get('knowledgeBaseSummaries', [])
+                
+                if not page.get('nextToken'):
+                    return
+                kwargs['nextToken'] = page['nextToken']
             
         except ClientError as e:
-            print(f"❌ Error listing knowledge bases: {e}")
-            return []
+            log.error(f"❌ Error listing knowledge bases: {e}")
+    
+    def list_knowledge_bases(self) -> List[Dict[str, Any]]:
+        """List all knowledge bases in the account"""
+        log.info(f"🔍 Listing Knowledge Bases in region {self.region}...")
+        
+        knowledge_bases = list(self.iter_knowledge_bases())
+        
+        log.info(f"📊 Found {len(knowledge_bases)} Knowledge Bases")
+        
+        for i, kb in enumerate(knowledge_bases, 1):
+            log.info(f"  {i}. {kb['name']} (ID: {kb['knowledgeBaseId']}) - Status: {kb['status']}")
+        
+        return knowledge_bases
     
     def list_data_sources(self, kb_id: str) -> List[Dict[str, Any]]:
         """List all data sources for a knowledge base"""
         try:
             data_sources = []
-            paginator = self.bedrock_client.get_paginator('list_data_sources')
+            kwargs = {'knowledgeBaseId': kb_id, 'maxResults': PAGE_SIZE}
             
-            for page in paginator.paginate(knowledgeBaseId=kb_id):
+            # Paginate by hand so each page goes through the stale-connection retry
+            while True:
+                page = self._call('list_data_sources', **kwargs)
                 data_sources.extend(page.get('dataSourceSummaries', []))
-            
-            return data_sources
+                
+                if not page.get('nextToken'):
+                    return data_sources
+                kwargs['nextToken'] = page['nextToken']
             
         except ClientError as e:
-            print(f"⚠️  Error listing data sources for KB {kb_id}: {e}")
+            log.warning(f"⚠️  Error listing data sources for KB {kb_id}: {e}")
             return []
     
+    # Outcome reporting and decisions shared by the threaded and async paths
+    
+    def _retain_request(self, kb_id: str, data_source_id: str, data_source: Dict[str, Any]) -> Dict[str, Any]:
+        """UpdateDataSource arguments that switch data_source to RETAIN"""
+        return {
+            'knowledgeBaseId': kb_id,
+            'dataSourceId': data_source_id,
+            'name': data_source['name'],
+            'dataSourceConfiguration': data_source['dataSourceConfiguration'],
+            'dataDeletionPolicy': 'RETAIN'
+        }
+    
+    def _retain_updated(self, data_source_id: str, error: Optional[ClientError] = None) -> bool:
+        """Report switching a data source to RETAIN"""
+        if error is not None:
+            log.warning(f"    ⚠️  Failed to update data source {data_source_id} deletion policy: {error}")
+            return False
+        
+        log.info(f"    ✅ Updated data source {data_source_id} deletion policy to RETAIN")
+        return True
+    
+    def _ds_deleted(self, kb_id: str, data_source_id: str, error: Optional[str] = None) -> bool:
+        """Report a data source deletion"""
+        if error is not None:
+            log.error(f"    ❌ Failed to delete data source {data_source_id}: {error}")
+            self._emit_ds(kb_id, data_source_id, error=error)
+            return False
+        
+        log.info(f"    ✅ Deleted data source {data_source_id}")
+        self._emit_ds(kb_id, data_source_id)
+        return True
+    
+    def _retry_with_retain(self, kb_id: str, data_source_id: str, error: ClientError) -> bool:
+        """Return True if a failed delete should be retried after switching to RETAIN, else report it"""
+        error_message = error.response['Error']['Message']
+        
+        if 'vector store' not in error_message.lower():
+            self._ds_deleted(kb_id, data_source_id, error=error_message)
+            return False
+        
+        log.warning("    ⚠️  Vector store error, updating deletion policy...")
+        return True
+    
+    def _log_ds_start(self, ds: Dict[str, Any]) -> None:
+        """Report the start of a data source deletion"""
+        log.info(f"    🗑️  Deleting data source: {ds['name']} (ID: {ds['dataSourceId']})")
+    
+    def _log_ds_wait(self, kb_id: str, attempt: int, attempts: int) -> None:
+        """Report one check of wait_for_data_sources_deleted that still found data sources"""
+        if attempt == 0:
+            log.info("    ⏳ Waiting for data source deletions to complete...")
+        elif attempt == attempts - 1:
+            log.warning(f"    ⚠️  Data sources for KB {kb_id} still present after {attempts} checks")
+    
+    def _log_kb_start(self, kb_id: str, kb_name: str) -> None:
+        """Report the start of a knowledge base deletion"""
+        log.info(f"🗑️  Deleting Knowledge Base: {kb_name} (ID: {kb_id})")
+    
+    def _log_ds_found(self, data_sources: List[Dict[str, Any]]) -> None:
+        """Report the data sources a knowledge base deletion has to remove first"""
+        log.info(f"  📁 Found {len(data_sources)} data sources to delete first")
+    
+    def _kb_deleted(self, kb_id: str, kb_name: str, start: float, error: Optional[str] = None) -> bool:
+        """Report a knowledge base deletion"""
+        if error is not None:
+            log.error(f"❌ Failed to delete Knowledge Base {kb_name}")
+            log.error(f"    Error: {error}")
+            self._emit_kb(kb_id, kb_name, start, error=error)
+            return False
+        
+        log.info(f"✅ Successfully deleted Knowledge Base: {kb_name}")
+        self._emit_kb(kb_id, kb_name, start)
+        return True
+    
+    def _deleting_poll_result(self, kb_id: str, kb_name: str, start: float,
+                              response: Optional[Dict[str, Any]] = None,
+                              error: Optional[ClientError] = None) -> Optional[bool]:
+        """Interpret one status check of a DELETING knowledge base: True or False once settled, None to keep polling"""
+        if error is not None:
+            if error.response['Error']['Code'] == 'ResourceNotFoundException':
+                log.info(f"✅ Knowledge Base {kb_name} finished deleting")
+                self._emit_kb(kb_id, kb_name, start)
+                return True
+            
+            log.error(f"❌ Failed to check Knowledge Base {kb_name}: {error.response['Error']['Message']}")
+            self._emit_kb(kb_id, kb_name, start, error=error.response['Error']['Message'])
+            return False
+        
+        status = response['knowledgeBase']['status']
+        if status != 'DELETING':
+            log.error(f"❌ Knowledge Base {kb_name} left DELETING with status {status}")
+            self._emit_kb(kb_id, kb_name, start, error=f"Left DELETING with status {status}")
+            return False
+        
+        return None
+    
+    def _deleting_timed_out(self, kb_id: str, kb_name: str, start: float, timeout: int) -> bool:
+        """Report a DELETING knowledge base that outlasted the wait"""
+        log.error(f"❌ Knowledge Base {kb_name} still DELETING after {timeout}s")
+        self._emit_kb(kb_id, kb_name, start, error=f"Still DELETING after {timeout}s")
+        return False
+    
+    def _dry_run_skip(self, kb_id: str, kb_name: str, deleting: bool) -> bool:
+        """Log what a dry run would do with a knowledge base; True if this is a dry run"""
+        if not self.dry_run:
+            return False
+        
+        if deleting:
+            log.info(f"🔍 [DRY RUN] KB already being deleted: {kb_name} (ID: {kb_id})")
+        else:
+            log.info(f"🔍 [DRY RUN] Would delete KB: {kb_name} (ID: {kb_id})")
+        return True
+    
     def update_data_source_deletion_policy(self, kb_id: str, data_source_id: str) -> bool:
         """Update data source deletion policy to RETAIN to avoid vector store issues"""
         try:
-            # Get current data source configuration
-            response = self.bedrock_client.get_data_source(
-                knowledgeBaseId=kb_id,
-                dataSourceId=data_source_id
-            )
-            
-            data_source = response['dataSource']
+            # Get current data source configuration, fetching it only once
+            key = (kb_id, data_source_id)
+            data_source = self._ds_cache.get(key)
             
-            # Update the deletion policy to RETAIN
-            self.bedrock_client.update_data_source(
-                knowledgeBaseId=kb_id,
-                dataSourceId=data_source_id,
-                name=data_source['name'],
-                dataSourceConfiguration=data_source['dataSourceConfiguration'],
-                dataDeletionPolicy='RETAIN'
-            )
+            if data_source is None:
+                data_source = self._call(
+                    'get_data_source',
+                    knowledgeBaseId=kb_id,
+                    dataSourceId=data_source_id
+                )['dataSource']
+                self._ds_cache[key] = data_source
             
-            print(f"    ✅ Updated data source {data_source_id} deletion policy to RETAIN")
-            return True
+            self._call('update_data_source', **self._retain_request(kb_id, data_source_id, data_source))
             
         except ClientError as e:
-            print(f"    ⚠️  Failed to update data source {data_source_id} deletion policy: {e}")
-            return False
+            return self._retain_updated(data_source_id, error=e)
+        
+        return self._retain_updated(data_source_id)
     
-    def delete_data_source(self, kb_id: str, data_source_id: str, max_retries: int = 3) -> bool:
-        """Delete a data source with retries"""
-        for attempt in range(max_retries):
+    def delete_data_source(self, kb_id: str, data_source_id: str) -> bool:
+        """Delete a data source, switching it to RETAIN once on vector store errors"""
+        try:
+            self._call('delete_data_source', knowledgeBaseId=kb_id, dataSourceId=data_source_id)
+            
+        except ClientError as e:
+            if not self._retry_with_retain(kb_id, data_source_id, e):
+                return False
+            
+            if not self.update_data_source_deletion_policy(kb_id, data_source_id):
+                return self._ds_deleted(kb_id, data_source_id, error=e.response['Error']['Message'])
+            
             try:
-                self.bedrock_client.delete_data_source(
-                    knowledgeBaseId=kb_id,
-                    dataSourceId=data_source_id
-                )
-                
-                print(f"    ✅ Deleted data source {data_source_id}")
-                return True
-                
+                self._call('delete_data_source', knowledgeBaseId=kb_id, dataSourceId=data_source_id)
             except ClientError as e:
-                error_code = e.response['Error']['Code']
-                error_message = e.response['Error']['Message']
-                
-                if 'vector store' in error_message.lower() and attempt < max_retries - 1:
-                    print(f"    ⚠️  Vector store error on attempt {attempt + 1}, updating deletion policy...")
-                    self.update_data_source_deletion_policy(kb_id, data_source_id)
-                    time.sleep(2)
-                    continue
-                else:
-                    print(f"    ❌ Failed to delete data source {data_source_id}: {error_message}")
-                    return False
+                return self._ds_deleted(kb_id, data_source_id, error=e.response['Error']['Message'])
+        
+        return self._ds_deleted(kb_id, data_source_id)
+    
+    def wait_for_data_sources_deleted(self, kb_id: str, attempts: int = 8, interval: float = 1) -> bool:
+        """Poll until a knowledge base has no data sources left, checking before each sleep"""
+        for attempt in range(attempts):
+            if not self.list_data_sources(kb_id):
+                return True
+            
+            self._log_ds_wait(kb_id, attempt, attempts)
+            if attempt < attempts - 1:
+                time.sleep(interval)
         
         return False
     
-    def delete_knowledge_base(self, kb_id: str, kb_name: str, max_retries: int = 3) -> bool:
-        """Delete a knowledge base with all its data sources"""
+    def wait_for_knowledge_base_deleted(self, kb_id: str, kb_name: str, timeout: int = 120, interval: int = 5) -> bool:
+        """Poll a knowledge base the service is already deleting until it is gone"""
+        if self._dry_run_skip(kb_id, kb_name, deleting=True):
+            return True
         
-        if self.dry_run:
-            print(f"🔍 [DRY RUN] Would delete KB: {kb_name} (ID: {kb_id})")
+        log.info(f"⏳ Knowledge Base {kb_name} (ID: {kb_id}) is already DELETING, waiting...")
+        start = time.monotonic()
+        deadline = start + timeout
+        
+        while time.monotonic() < deadline:
+            try:
+                result = self._deleting_poll_result(
+                    kb_id, kb_name, start, response=self._call('get_knowledge_base', knowledgeBaseId=kb_id))
+            except ClientError as e:
+                result = self._deleting_poll_result(kb_id, kb_name, start, error=e)
+            
+            if result is not None:
+                return result
+            time.sleep(interval)
+        
+        return self._deleting_timed_out(kb_id, kb_name, start, timeout)
+    
+    def delete_knowledge_base(self, kb_id: str, kb_name: str) -> bool:
+        """Delete a knowledge base with all its data sources"""
+        if self._dry_run_skip(kb_id, kb_name, deleting=False):
             return True
         
-        print(f"🗑️  Deleting Knowledge Base: {kb_name} (ID: {kb_id})")
+        self._log_kb_start(kb_id, kb_name)
+        start = time.monotonic()
         
         # First, list and delete all data sources
         data_sources = self.list_data_sources(kb_id)
         
         if data_sources:
-            print(f"  📁 Found {len(data_sources)} data sources to delete first")
+            self._log_ds_found(data_sources)
             
-            for ds in data_sources:
-                ds_id = ds['dataSourceId']
-                ds_name = ds['name']
-                print(f"    🗑️  Deleting data source: {ds_name} (ID: {ds_id})")
+            def delete_ds(ds):
+                self._log_ds_start(ds)
                 
-                if not self.delete_data_source(kb_id, ds_id):
-                    print(f"    ⚠️  Continuing despite data source deletion failure...")
+                # Skip the failed-delete round-trip by switching to RETAIN up front
+                if self.fast_retain:
+                    self.update_data_source_deletion_policy(kb_id, ds['dataSourceId'])
+                
+                if not self.delete_data_source(kb_id, ds['dataSourceId']):
+                    log.warning(f"    ⚠️  Continuing despite data source deletion failure...")
+            
+            with ThreadPoolExecutor(max_workers=min(MAX_DS_WORKERS, len(data_sources))) as executor:
+                list(executor.map(delete_ds, data_sources))
+            
+            self.wait_for_data_sources_deleted(kb_id)
         
-        # Wait a bit for data sources to be fully deleted
-        if data_sources:
-            print("    ⏳ Waiting for data source deletions to complete...")
-            time.sleep(5)
+        # Now delete the knowledge base itself; throttling and transient
+        # errors are already retried by botocore
+        try:
+            self.rl.acquire()
+            self._call('delete_knowledge_base', knowledgeBaseId=kb_id)
+        except ClientError as e:
+            return self._kb_deleted(kb_id, kb_name, start, error=e.response['Error']['Message'])
         
-        # Now delete the knowledge base itself
-        for attempt in range(max_retries):
-            try:
-                self.bedrock_client.delete_knowledge_base(knowledgeBaseId=kb_id)
-                print(f"✅ Successfully deleted Knowledge Base: {kb_name}")
-                return True
+        return self._kb_deleted(kb_id, kb_name, start)
+    
+    def _throttle_pause(self) -> float:
+        """Return how long to pause dispatching for the throttling seen since the last check"""
+        with self._throttle_lock:
+            throttle_count = self._throttle_count
+            self._throttle_count = 0
+        
+        if not throttle_count:
+            return 0
+        
+        sleep_s = min(30, 2 ** throttle_count)
+        log.warning(f"⚠️  {throttle_count} throttled calls, pausing {sleep_s}s before the next deletion...")
+        return sleep_s
+    
+    def _throttle_backoff(self) -> None:
+        """Pause dispatching in proportion to the throttling seen since the last check"""
+        sleep_s = self._throttle_pause()
+        if sleep_s:
+            time.sleep(sleep_s)
+    
+    async def _athrottle_backoff(self) -> None:
+        """Async counterpart of _throttle_backoff"""
+        sleep_s = self._throttle_pause()
+        if sleep_s:
+            await asyncio.sleep(sleep_s)
+    
+    def _delete_all_threaded(self, knowledge_bases: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+        """Delete knowledge bases on a thread pool, returning (successes, failures)
+        
+        knowledge_bases may be a lazy iterator: at most 2 * batch_size deletions
+        are queued at once, so workers start while later pages are still listed.
+        """
+        success_count = 0
+        failure_count = 0
+        pending = {}
+        
+        def collect(return_when):
+            nonlocal success_count, failure_count
+            done, _ = wait(pending, return_when=return_when)
+            
+            for future in done:
+                kb = pending.pop(future)
                 
-            except ClientError as e:
-                error_code = e.response['Error']['Code']
-                error_message = e.response['Error']['Message']
+                try:
+                    deleted = future.result()
+                except Exception as e:
+                    log.error(f"❌ Unexpected error deleting Knowledge Base {kb['name']}: {e}")
+                    deleted = False
                 
-                if attempt < max_retries - 1:
-                    print(f"⚠️  Deletion attempt {attempt + 1} failed, retrying in 10 seconds...")
-                    print(f"    Error: {error_message}")
-                    time.sleep(10)
+                if deleted:
+                    success_count += 1
                 else:
-                    print(f"❌ Failed to delete Knowledge Base {kb_name} after {max_retries} attempts")
-                    print(f"    Final error: {error_message}")
-                    return False
+                    failure_count += 1
+                
+                log.info(f"[{success_count + failure_count}] Finished: {kb['name']}")
+        
+        # Each deletion is an independent, I/O-bound call sequence, so fan the
+        # KBs out over a thread pool; the boto3 client is safe to share.
+        with ThreadPoolExecutor(max_workers=self.batch_size) as executor:
+            for kb in knowledge_bases:
+                if len(pending) >= self.batch_size * 2:
+                    collect(FIRST_COMPLETED)
+                    self._throttle_backoff()
+                
+                # KBs the service is already tearing down only need a status poll
+                if kb.get('status') == 'DELETING':
+                    handler = self.wait_for_knowledge_base_deleted
+                else:
+                    handler = self.delete_knowledge_base
+                
+                future = executor.submit(handler, kb['knowledgeBaseId'], kb['name'])
+                pending[future] = kb
+            
+            if pending:
+                collect(ALL_COMPLETED)
+        
+        return success_count, failure_count
+    
+    async def _acall(self, client, operation: str, **kwargs) -> Dict[str, Any]:
+        """Async counterpart of _call
+        
+        aiohttp drops a dead connection from its pool, so retrying once on a fresh
+        connection stands in for rebuilding the client.
+        """
+        try:
+            return await getattr(client, operation)(**kwargs)
+        except Exception as e:
+            if not is_stale_connection_error(e):
+                raise
+            
+            log.warning(f"    ⚠️  Stale connection ({type(e).__name__}), retrying...")
+            return await getattr(client, operation)(**kwargs)
+    
+    async def _alist_data_sources(self, client, kb_id: str) -> List[Dict[str, Any]]:
+        """Async counterpart of list_data_sources"""
+        try:
+            data_sources = []
+            kwargs = {'knowledgeBaseId': kb_id, 'maxResults': PAGE_SIZE}
+            
+            while True:
+                page = await self._acall(client, 'list_data_sources', **kwargs)
+                data_sources.extend(page.get('dataSourceSummaries', []))
+                
+                if not page.get('nextToken'):
+                    return data_sources
+                kwargs['nextToken'] = page['nextToken']
+            
+        except ClientError as e:
+            log.warning(f"⚠️  Error listing data sources for KB {kb_id}: {e}")
+            return []
+    
+    async def _aupdate_data_source_deletion_policy(self, client, kb_id: str, data_source_id: str) -> bool:
+        """Async counterpart of update_data_source_deletion_policy"""
+        try:
+            key = (kb_id, data_source_id)
+            data_source = self._ds_cache.get(key)
+            
+            if data_source is None:
+                response = await self._acall(client, 'get_data_source',
+                                             knowledgeBaseId=kb_id, dataSourceId=data_source_id)
+                data_source = self._ds_cache[key] = response['dataSource']
+            
+            await self._acall(client, 'update_data_source', **self._retain_request(kb_id, data_source_id, data_source))
+            
+        except ClientError as e:
+            return self._retain_updated(data_source_id, error=e)
+        
+        return self._retain_updated(data_source_id)
+    
+    async def _adelete_data_source(self, client, kb_id: str, ds: Dict[str, Any]) -> bool:
+        """Async counterpart of delete_data_source, including the fast-retain step"""
+        data_source_id = ds['dataSourceId']
+        self._log_ds_start(ds)
+        
+        if self.fast_retain:
+            await self._aupdate_data_source_deletion_policy(client, kb_id, data_source_id)
+        
+        try:
+            await self._acall(client, 'delete_data_source', knowledgeBaseId=kb_id, dataSourceId=data_source_id)
+            
+        except ClientError as e:
+            if not self._retry_with_retain(kb_id, data_source_id, e):
+                return False
+            
+            if not await self._aupdate_data_source_deletion_policy(client, kb_id, data_source_id):
+                return self._ds_deleted(kb_id, data_source_id, error=e.response['Error']['Message'])
+            
+            try:
+                await self._acall(client, 'delete_data_source', knowledgeBaseId=kb_id, dataSourceId=data_source_id)
+            except ClientError as e:
+                return self._ds_deleted(kb_id, data_source_id, error=e.response['Error']['Message'])
+        
+        return self._ds_deleted(kb_id, data_source_id)
+    
+    async def _await_data_sources_deleted(self, client, kb_id: str, attempts: int = 8, interval: float = 1) -> bool:
+        """Async counterpart of wait_for_data_sources_deleted"""
+        for attempt in range(attempts):
+            if not await self._alist_data_sources(client, kb_id):
+                return True
+            
+            self._log_ds_wait(kb_id, attempt, attempts)
+            if attempt < attempts - 1:
+                await asyncio.sleep(interval)
         
         return False
     
-    def delete_all_knowledge_bases(self, confirm: bool = False) -> None:
-        """Delete all knowledge bases in the account"""
+    async def _await_knowledge_base_deleted(self, client, kb_id: str, kb_name: str,
+                                            timeout: int = 120, interval: int = 5) -> bool:
+        """Async counterpart of wait_for_knowledge_base_deleted"""
+        if self._dry_run_skip(kb_id, kb_name, deleting=True):
+            return True
         
-        knowledge_bases = self.list_knowledge_bases()
+        log.info(f"⏳ Knowledge Base {kb_name} (ID: {kb_id}) is already DELETING, waiting...")
+        start = time.monotonic()
+        deadline = start + timeout
         
-        if not knowledge_bases:
-            print("✅ No Knowledge Bases found to delete.")
-            return
+        while time.monotonic() < deadline:
+            try:
+                result = self._deleting_poll_result(
+                    kb_id, kb_name, start,
+                    response=await self._acall(client, 'get_knowledge_base', knowledgeBaseId=kb_id))
+            except ClientError as e:
+                result = self._deleting_poll_result(kb_id, kb_name, start, error=e)
+            
+            if result is not None:
+                return result
+            await asyncio.sleep(interval)
         
-        if not self.dry_run and not confirm:
-            print(f"\n⚠️  WARNING: This will delete ALL {len(knowledge_bases)} Knowledge Bases!")
-            print("This action cannot be undone.")
-            response = input("Are you sure you want to continue? (type 'DELETE' to confirm): ")
+        return self._deleting_timed_out(kb_id, kb_name, start, timeout)
+    
+    async def _adelete_kb(self, client, kb: Dict[str, Any], semaphore: asyncio.Semaphore) -> bool:
+        """Async counterpart of delete_knowledge_base"""
+        kb_id = kb['knowledgeBaseId']
+        kb_name = kb['name']
+        
+        async with semaphore:
+            await self._athrottle_backoff()
             
-            if response != 'DELETE':
-                print("❌ Operation cancelled.")
-                return
+            if kb.get('status') == 'DELETING':
+                return await self._await_knowledge_base_deleted(client, kb_id, kb_name)
+            
+            if self._dry_run_skip(kb_id, kb_name, deleting=False):
+                return True
+            
+            self._log_kb_start(kb_id, kb_name)
+            start = time.monotonic()
+            
+            data_sources = await self._alist_data_sources(client, kb_id)
+            
+            if data_sources:
+                self._log_ds_found(data_sources)
+                
+                # Same per-KB fan-out cap as the threaded path
+                ds_semaphore = asyncio.Semaphore(MAX_DS_WORKERS)
+                
+                async def delete_ds(ds):
+                    async with ds_semaphore:
+                        return await self._adelete_data_source(client, kb_id, ds)
+                
+                results = await asyncio.gather(*[delete_ds(ds) for ds in data_sources])
+                if not all(results):
+                    log.warning("    ⚠️  Continuing despite data source deletion failure...")
+                
+                await self._await_data_sources_deleted(client, kb_id)
+            
+            try:
+                await self.rl.aacquire()
+                await self._acall(client, 'delete_knowledge_base', knowledgeBaseId=kb_id)
+            except ClientError as e:
+                return self._kb_deleted(kb_id, kb_name, start, error=e.response['Error']['Message'])
+            
+            return self._kb_deleted(kb_id, kb_name, start)
+    
+    def _aioboto3_session(self, aioboto3):
+        """Build an aioboto3 session matching self.session's profile and region
         
-        print(f"\n🚀 Starting deletion of {len(knowledge_bases)} Knowledge Bases...")
+        aioboto3 resolves its own, refreshable credential chain for the profile;
+        only keys passed explicitly to self.session are copied over.
+        """
+        credentials = self.session.get_credentials()
+        if credentials is None:
+            raise NoCredentialsError()
         
-        success_count = 0
-        failure_count = 0
+        if credentials.method == 'explicit':
+            frozen = credentials.get_frozen_credentials()
+            return aioboto3.Session(
+                aws_access_key_id=frozen.access_key,
+                aws_secret_access_key=frozen.secret_key,
+                aws_session_token=frozen.token,
+                region_name=self.region
+            )
         
-        for i, kb in enumerate(knowledge_bases, 1):
-            kb_id = kb['knowledgeBaseId']
-            kb_name = kb['name']
+        # 'default' is what boto3 reports when no profile was chosen; naming it
+        # explicitly would turn off the environment credential provider
+        profile_name = self.session.profile_name
+        return aioboto3.Session(
+            profile_name=None if profile_name == 'default' else profile_name,
+            region_name=self.region
+        )
+    
+    async def _adelete_all(self, knowledge_bases: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """Delete knowledge bases on one aioboto3 client, returning (successes, failures)"""
+        import aioboto3
+        
+        semaphore = asyncio.Semaphore(self.batch_size)
+        
+        session = self._aioboto3_session(aioboto3)
+        
+        # Keep a single client open for the whole run so its TLS pool is reused
+        async with session.client('bedrock-agent', config=self._client_config) as client:
+            self._watch_throttling(client)
+            results = await asyncio.gather(
+                *[self._adelete_kb(client, kb, semaphore) for kb in knowledge_bases],
+                return_exceptions=True
+            )
+        
+        for kb, result in zip(knowledge_bases, results):
+            if isinstance(result, Exception):
+                log.error(f"❌ Unexpected error deleting Knowledge Base {kb['name']}: {result}")
+        
+        success_count = sum(1 for result in results if result is True)
+        return success_count, len(results) - success_count
+    
+    def delete_all_knowledge_bases(self, confirm: bool = False) -> None:
+        """Delete all knowledge bases in the account"""
+        
+        if confirm and not self.dry_run and not self.use_async:
+            # Nothing to show up front, so start deleting while pages are listed
+            log.info(f"🔍 Listing Knowledge Bases in region {self.region}...")
+            log.info("\n🚀 Deleting Knowledge Bases as they are listed...")
             
-            print(f"\n[{i}/{len(knowledge_bases)}] Processing: {kb_name}")
+            success_count, failure_count = self._delete_all_threaded(self.iter_knowledge_bases())
             
-            if self.delete_knowledge_base(kb_id, kb_name):
-                success_count += 1
-            else:
-                failure_count += 1
+            if success_count + failure_count == 0:
+                log.info("✅ No Knowledge Bases found to delete.")
+                return
+        
+        else:
+            knowledge_bases = self.list_knowledge_bases()
+            
+            if not knowledge_bases:
+                log.info("✅ No Knowledge Bases found to delete.")
+                return
+            
+            if not self.dry_run and not confirm:
+                log.warning(f"\n⚠️  WARNING: This will delete ALL {len(knowledge_bases)} Knowledge Bases!")
+                log.warning("This action cannot be undone.")
+                flush_logs()
+                # The prompt goes to stderr so stdout stays pure JSON in --json mode
+                sys.stderr.write("Are you sure you want to continue? (type 'DELETE' to confirm): ")
+                sys.stderr.flush()
+                response = input()
+                
+                if response != 'DELETE':
+                    log.error("❌ Operation cancelled.")
+                    return
+            
+            log.info(f"\n🚀 Starting deletion of {len(knowledge_bases)} Knowledge Bases...")
             
-            # Small delay between deletions to avoid rate limiting
-            if not self.dry_run and i < len(knowledge_bases):
-                time.sleep(2)
+            if self.use_async:
+                success_count, failure_count = asyncio.run(self._adelete_all(knowledge_bases))
+            else:
+                success_count, failure_count = self._delete_all_threaded(knowledge_bases)
+        
+        self._emit({'event': 'summary', 'successful': success_count, 'failed': failure_count})
         
-        print(f"\n📊 Deletion Summary:")
-        print(f"  ✅ Successful: {success_count}")
-        print(f"  ❌ Failed: {failure_count}")
+        log.info(f"\n📊 Deletion Summary:")
+        log.info(f"  ✅ Successful: {success_count}")
+        log.info(f"  ❌ Failed: {failure_count}")
         
         if failure_count > 0:
-            print(f"\n💡 For failed deletions, you might need to:")
-            print("  1. Check vector store permissions in your AWS account")
-            print("  2. Manually delete vector store resources (OpenSearch, Pinecone, etc.)")
-            print("  3. Contact AWS Support if issues persist")
+            log.info(f"\n💡 For failed deletions, you might need to:")
+            log.info("  1. Check vector store permissions in your AWS account")
+            log.info("  2. Manually delete vector store resources (OpenSearch, Pinecone, etc.)")
+            log.info("  3. Contact AWS Support if issues persist")
 
 def main():
     parser = argparse.ArgumentParser(description='Delete AWS Bedrock Knowledge Bases')
     parser.add_argument('--region', default='us-east-1', help='AWS region (default: us-east-1)')
     parser.add_argument('--dry-run', action='store_true', help='List KBs without deleting them')
     parser.add_argument('--confirm', action='store_true', help='Skip confirmation prompt')
+    parser.add_argument('--batch-size', type=int, default=4,
+                        help='Number of Knowledge Bases to delete concurrently (default: 4)')
+    parser.add_argument('--fast-retain', action='store_true',
+                        help='Set data sources to RETAIN before deleting them instead of after a vector store error')
+    parser.add_argument('--use-async', action='store_true',
+                        help='Delete with aioboto3 on an asyncio event loop (requires aioboto3)')
+    parser.add_argument('--max-tps', type=float, default=4.0,
+                        help='Maximum DeleteKnowledgeBase calls per second (default: 4)')
+    parser.add_argument('--json', action='store_true',
+                        help='Write one JSON object per deletion event to stdout (logs go to stderr)')
     parser.add_argument('--list-regions', action='store_true', help='List common AWS regions with Bedrock')
     
     args = parser.parse_args()
+    if args.max_tps <= 0:
+        parser.error('--max-tps must be greater than 0')
+    # Keep stdout machine-parseable in JSON mode
+    listener = setup_logging(sys.stderr if args.json else sys.stdout)
     
+    try:
+        run(args)
+    finally:
+        listener.stop()
+
+def run(args: argparse.Namespace) -> None:
+    """Run the cleaner for parsed command line arguments"""
     if args.list_regions:
-        print("Common AWS regions with Bedrock support:")
+        log.info("Common AWS regions with Bedrock support:")
         regions = [
             'us-east-1', 'us-west-2', 'eu-west-1', 'eu-central-1', 
             'ap-southeast-1', 'ap-northeast-1', 'ca-central-1'
         ]
         for region in regions:
-            print(f"  - {region}")
+            log.info(f"  - {region}")
         return
     
-    print("🤖 AWS Bedrock Knowledge Base Cleaner")
-    print("=" * 50)
+    log.info("🤖 AWS Bedrock Knowledge Base Cleaner")
+    log.info("=" * 50)
     
-    cleaner = BedrockKBCleaner(region=args.region, dry_run=args.dry_run)
+    cleaner = BedrockKBCleaner(region=args.region, dry_run=args.dry_run, batch_size=args.batch_size,
+                               fast_retain=args.fast_retain, use_async=args.use_async,
+                               json_output=args.json, max_tps=args.max_tps)
     cleaner.delete_all_knowledge_bases(confirm=args.confirm)
 
 if __name__ == "__main__":
@@ -1,12 +1,19 @@
+import asyncio
 import boto3
+import codecs
 import time
 import uuid
 import json
+import logging
+import random
+import threading
 from requests_aws4auth import AWS4Auth
 import requests
-import time
-import uuid
 import botocore.exceptions
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
 
 
 region = "us-east-1"
@@ -18,185 +25,283 @@ agent_name = "Test-Agent_GENAI-3"
 # instruction = " You are a helpful assistant that answers questions using the knowledge base For questions about data transformations, respond with the source tables, target tables, and transformation logic in JSON format."
 
 
-aoss = boto3.client("opensearchserverless", region_name=region)
-bedrock = boto3.client("bedrock-agent", region_name=region)
-runtime = boto3.client("bedrock-agent-runtime", region_name=region)
-sts = boto3.client("sts", region_name=region)
+logger = logging.getLogger(__name__)
+
+# One session and one pooled, keep-alive client config shared by every AWS client
+session = boto3.Session(region_name=region)
+client_config = Config(
+    max_pool_connections=50,
+    retries={"mode": "adaptive", "max_attempts": 5},
+    tcp_keepalive=True
+)
+aoss = session.client("opensearchserverless", config=client_config)
+bedrock = session.client("bedrock-agent", config=client_config)
+runtime = session.client("bedrock-agent-runtime", config=client_config)
+sts = session.client("sts", config=client_config)
 # account_id = sts.get_caller_identity()["Account"]
-def ensure_opensearch_policies():
-    print("Ensuring OpenSearch Serverless security policies...")
 
-    
-    try:
-        aoss.create_security_policy(
-            name="encryption-policy-genai",
-            type="encryption",
-            policy=json.dumps({
-                "Rules": [{"ResourceType": "collection", "Resource": ["collection/*"]}],
-                "AWSOwnedKey": True
-            })
-        )
-        print("Encryption policy created.")
-    except aoss.exceptions.ConflictException:
-        print("Encryption policy already exists.")
+# Reuse TLS connections for the signed OpenSearch Serverless HTTP calls
+http = requests.Session()
+http.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=10))
+
+try:
+    import orjson
+
+    def _dumps_bytes(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    def _dumps_bytes(obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+# Static OpenSearch Serverless documents, serialized once at import; boto3 takes the policies as str
+_ENCRYPTION_POLICY_JSON = _dumps_bytes({
+    "Rules": [{"ResourceType": "collection", "Resource": ["collection/*"]}],
+    "AWSOwnedKey": True
+}).decode()
+
+_NETWORK_POLICY_JSON = _dumps_bytes([{
+    "Rules": [{"ResourceType": "collection", "Resource": ["collection/*"]}],
+    "AllowFromPublic": True
+}]).decode()
+
+_DATA_POLICY_JSON = _dumps_bytes([{
+    "Rules": [
+        {
+            "ResourceType": "collection",
+            "Resource": ["collection/test-genai-1"],
+            "Permission": ["aoss:*"]
+        },
+        {
+            "ResourceType": "index",
+            "Resource": ["index/test-genai-1/genai-index"],
+            "Permission": ["aoss:*"]
+        }
+    ],
+    "Principal": [
+        "arn:aws:iam::406099943223:role/BedrockKBRole",
+        "arn:aws:iam::406099943223:role/BedrockKnowledgeBaseAccessRole",
+        "arn:aws:iam::406099943223:user/GenAI_Offshore_team_test"
+    ]
+}]).decode()
+
+# Pre-encoded so each PUT sends the bytes as-is
+_INDEX_CONFIG_JSON = _dumps_bytes({
+    "settings": {
+        "index": {
+            "knn": True,
+            "knn.algo_param.ef_search": 512
+        }
+    },
+    "mappings": {
+        "properties": {
+            "vector": {
+                "type": "knn_vector",
+                "dimension": 1536,
+                "method": {
+                    "name": "hnsw",
+                    "space_type": "l2",
+                    "engine": "faiss",
+                    "parameters": {
+                        "ef_construction": 512,
+                        "m": 16
+                    }
+                }
+            },
+            "text": {"type": "text"},
+            "metadata": {"type": "keyword"}
+        }
+    }
+})
 
-    
-    try:
-        aoss.create_security_policy(
-            name="network-policy-genai",
-            type="network",
-            policy=json.dumps([{
-                "Rules": [{"ResourceType": "collection", "Resource": ["collection/*"]}],
-                "AllowFromPublic": True
-            }])
-        )
-        print("Network policy created.")
-    except aoss.exceptions.ConflictException:
-        print("Network policy already exists.")
+def poll_until(fn, predicate, initial=1.0, cap=30.0, timeout=600, what="condition", describe=str, stop=None):
+    """Call fn until predicate(result) holds, sleeping with exponential backoff and jitter between calls.
 
-    
-    policy_name = "data-policy-test-genai-1"
-    access_policy_document = [{
-        "Rules": [
-            {
-                "ResourceType": "collection",
-                "Resource": ["collection/test-genai-1"],
-                "Permission": ["aoss:*"]
-            },
-            {
-                "ResourceType": "index",
-                "Resource": ["index/test-genai-1/genai-index"],
-                "Permission": ["aoss:*"]
-            }
-        ],
-        "Principal": [
-            "arn:aws:iam::406099943223:role/BedrockKBRole",
-            "arn:aws:iam::406099943223:role/BedrockKnowledgeBaseAccessRole",
-            "arn:aws:iam::406099943223:user/GenAI_Offshore_team_test"
-        ]
-    }]
+    describe(result) is logged at debug level, only when it changes between polls.
+    Setting the optional threading.Event stop abandons the wait at the next sleep.
+    """
+    deadline = time.time() + timeout
+    delay = initial
+    last_status = None
+    while True:
+        result = fn()
+        status = describe(result)
+        if status != last_status:
+            logger.debug("%s: %s", what, status)
+            last_status = status
+        if predicate(result):
+            return result
+        if time.time() >= deadline:
+            raise TimeoutError(f"Timed out after {timeout} seconds waiting for {what}.")
+        sleep_s = delay + random.uniform(0, 0.3 * delay)
+        if stop is None:
+            time.sleep(sleep_s)
+        elif stop.wait(sleep_s):
+            raise RuntimeError(f"Stopped waiting for {what}.")
+        delay = min(cap, delay * 1.5)
 
-    try:
-        aoss.create_access_policy(
-            name=policy_name,
-            type="data",
-            policy=json.dumps(access_policy_document)
-        )
-        print("Data access policy created.")
-    except aoss.exceptions.ConflictException:
-        print("Data access policy already exists. Updating it...")
-        existing = aoss.list_access_policies(type="data", resource=["collection/test-genai-1"])
-        current_version = None
-        for policy in existing["accessPolicySummaries"]:
-            if policy["name"] == policy_name:
-                current_version = policy["policyVersion"]
-                break
-        if current_version:
+def ensure_opensearch_policies():
+    logger.info("Ensuring OpenSearch Serverless security policies...")
+    encryption_policy_name = "encryption-policy-genai"
+    network_policy_name = "network-policy-genai"
+    data_policy_name = "data-policy-test-genai-1"
+
+    def list_security_policy_names(policy_type):
+        names = set()
+        kwargs = {"type": policy_type}
+        while True:
+            response = aoss.list_security_policies(**kwargs)
+            names.update(policy["name"] for policy in response["securityPolicySummaries"])
+            if not response.get("nextToken"):
+                return names
+            kwargs["nextToken"] = response["nextToken"]
+
+    def list_data_policy_versions():
+        versions = {}
+        kwargs = {"type": "data", "resource": ["collection/test-genai-1"]}
+        while True:
+            response = aoss.list_access_policies(**kwargs)
+            versions.update((policy["name"], policy["policyVersion"])
+                            for policy in response["accessPolicySummaries"])
+            if not response.get("nextToken"):
+                return versions
+            kwargs["nextToken"] = response["nextToken"]
+
+    # List each policy type up front, so repeat runs skip the create calls entirely
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        encryption_future = executor.submit(list_security_policy_names, "encryption")
+        network_future = executor.submit(list_security_policy_names, "network")
+        data_future = executor.submit(list_data_policy_versions)
+        encryption_names = encryption_future.result()
+        network_names = network_future.result()
+        data_versions = data_future.result()
+
+    def create_encryption_policy():
+        if encryption_policy_name in encryption_names:
+            logger.info("Encryption policy already exists.")
+            return
+        try:
+            aoss.create_security_policy(
+                name=encryption_policy_name,
+                type="encryption",
+                policy=_ENCRYPTION_POLICY_JSON
+            )
+            logger.info("Encryption policy created.")
+        except aoss.exceptions.ConflictException:
+            logger.info("Encryption policy already exists.")
+
+    def create_network_policy():
+        if network_policy_name in network_names:
+            logger.info("Network policy already exists.")
+            return
+        try:
+            aoss.create_security_policy(
+                name=network_policy_name,
+                type="network",
+                policy=_NETWORK_POLICY_JSON
+            )
+            logger.info("Network policy created.")
+        except aoss.exceptions.ConflictException:
+            logger.info("Network policy already exists.")
+
+    def create_data_access_policy():
+        current_version = data_versions.get(data_policy_name)
+        if current_version is None:
             try:
-                aoss.update_access_policy(
-                    name=policy_name,
+                aoss.create_access_policy(
+                    name=data_policy_name,
                     type="data",
-                    policy=json.dumps(access_policy_document),
-                    policyVersion=current_version
+                    policy=_DATA_POLICY_JSON
                 )
-                print("Data access policy updated.")
-            except aoss.exceptions.ValidationException as e:
-                if "No changes detected" in str(e):
-                    print("No changes to update in data access policy.")
-                else:
-                    raise
-        else:
-            print("Couldn't find existing policy to update.")
+                logger.info("Data access policy created.")
+                return
+            except aoss.exceptions.ConflictException:
+                # Exists but no longer matches the resource filter of the listing
+                current_version = aoss.get_access_policy(
+                    name=data_policy_name, type="data"
+                )["accessPolicyDetail"]["policyVersion"]
+
+        logger.info("Data access policy already exists. Updating it...")
+        try:
+            aoss.update_access_policy(
+                name=data_policy_name,
+                type="data",
+                policy=_DATA_POLICY_JSON,
+                policyVersion=current_version
+            )
+            logger.info("Data access policy updated.")
+        except aoss.exceptions.ValidationException as e:
+            if "No changes detected" in str(e):
+                logger.info("No changes to update in data access policy.")
+            else:
+                raise
+
+    # The three policies are independent, so create them concurrently
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(fn) for fn in
+                   (create_encryption_policy, create_network_policy, create_data_access_policy)]
+        for future in as_completed(futures):
+            future.result()
 
 def create_collection(name):
-    print(f"Creating OpenSearch collection: {name}")
+    logger.info("Creating OpenSearch collection: %s", name)
     try:
         aoss.create_collection(name=name, type="VECTORSEARCH")
     except aoss.exceptions.ConflictException:
-        print("Collection already exists.")
-
-    while True:
-        resp = aoss.list_collections()
-        for col in resp["collectionSummaries"]:
-            if col["name"] == name and col["status"] == "ACTIVE":
-                print("Collection is ACTIVE")
-                collection_arn = col["arn"]
-                break
-        else:
-            print("Waiting for collection to become ACTIVE...")
-            time.sleep(10)
-            continue
-        break
-    create_vector_index(name, "genai-index")
+        logger.info("Collection already exists.")
+
+    def collection_detail():
+        # A just-created collection may not be visible yet, so an empty result keeps polling
+        details = aoss.batch_get_collection(names=[name])["collectionDetails"]
+        detail = details[0] if details else {"status": "NOT_FOUND"}
+        if detail["status"] == "FAILED":
+            raise Exception(f"Collection {name} creation FAILED.")
+        return detail
+
+    collection_arn = poll_until(collection_detail, lambda detail: detail["status"] == "ACTIVE", timeout=1800,
+                                what=f"collection {name} to become ACTIVE",
+                                describe=lambda detail: detail["status"])["arn"]
+    logger.info("Collection is ACTIVE")
+    create_vector_index(collection_arn, "genai-index")
     return collection_arn
 
-def create_vector_index(collection_name, index_name):
-    print(f"Creating vector index: {index_name}")
-    collections = aoss.list_collections()["collectionSummaries"]
-    collection_arn = next((col["arn"] for col in collections if col["name"] == collection_name), None)
-    if not collection_arn:
-        raise Exception(f"Collection ARN not found for {collection_name}")
+@lru_cache(maxsize=1)
+def _get_auth(region):
+    """SigV4 auth for OpenSearch Serverless, built once and refreshed as the session's credentials rotate."""
+    return AWS4Auth(
+        region=region,
+        service="aoss",
+        refreshable_credentials=session.get_credentials()
+    )
+
+@lru_cache(maxsize=8)
+def _endpoint_for(collection_arn: str) -> tuple:
+    """HTTPS endpoint and region of an OpenSearch Serverless collection, derived from its ARN."""
     try:
-        parts = collection_arn.split(":")
-        region = parts[3]
-        endpoint_name = collection_arn.split("/")[-1]
-        endpoint = f"{endpoint_name}.{region}.aoss.amazonaws.com"
+        col_region = collection_arn.split(":")[3]
+        collection_id = collection_arn.split("/")[-1]
     except Exception as e:
         raise Exception(f"Failed to parse endpoint from ARN: {e}")
+    return f"https://{collection_id}.{col_region}.aoss.amazonaws.com", col_region
 
-    url = f"https://{endpoint}/{index_name}"
+def create_vector_index(collection_arn, index_name):
+    logger.info("Creating vector index: %s", index_name)
+    endpoint, col_region = _endpoint_for(collection_arn)
+    url = f"{endpoint}/{index_name}"
     headers = {"Content-Type": "application/json"}
 
-    index_config = {
-        "settings": {
-            "index": {
-                "knn": True,
-                "knn.algo_param.ef_search": 512
-            }
-        },
-        "mappings": {
-            "properties": {
-                "vector": {
-                    "type": "knn_vector",
-                    "dimension": 1536,
-                    "method": {
-                        "name": "hnsw",
-                        "space_type": "l2",  
-                        "engine": "faiss",
-                        "parameters": {
-                            "ef_construction": 512,
-                            "m": 16
-                        }
-                    }
-                },
-                "text": {"type": "text"},
-                "metadata": {"type": "keyword"}
-            }
-        }
-    }
-
     try:
-        session = boto3.Session()
-        credentials = session.get_credentials().get_frozen_credentials()
-        aws_auth = AWS4Auth(
-            credentials.access_key,
-            credentials.secret_key,
-            region,
-            "aoss",
-            session_token=credentials.token
-        )
-        response = requests.put(url, headers=headers, auth=aws_auth, data=json.dumps(index_config))
+        response = http.put(url, headers=headers, auth=_get_auth(col_region), data=_INDEX_CONFIG_JSON)
         if response.status_code == 200:
-            print("Vector index created.")
+            logger.info("Vector index created.")
         elif response.status_code == 400 and 'resource_already_exists_exception' in response.text:
-            print("Vector index already exists.")
+            logger.info("Vector index already exists.")
         else:
             raise Exception(f"Failed to create vector index: {response.text}")
     except Exception as e:
-        print(f"Exception during vector index creation: {e}")
+        logger.error("Exception during vector index creation: %s", e)
 
 def create_knowledge_base(collection_arn):
-    print("Creating Knowledge Base...")
+    logger.info("Creating Knowledge Base...")
     index_name = "genai-index"
     response = bedrock.create_knowledge_base(
         name=f"kb-{uuid.uuid4().hex[:6]}",
@@ -222,24 +327,24 @@ def create_knowledge_base(collection_arn):
         }
     )
     kb_id = response["knowledgeBase"]["knowledgeBaseId"]
-    print("Knowledge Base created:", kb_id)
+    logger.info("Knowledge Base created: %s", kb_id)
     return kb_id
 
 def wait_for_kb_active(kb_id):
-    print("Waiting for Knowledge Base to become ACTIVE...")
-    while True:
+    logger.info("Waiting for Knowledge Base to become ACTIVE...")
+
+    def kb_status():
         response = bedrock.get_knowledge_base(knowledgeBaseId=kb_id)
         status = response["knowledgeBase"]["status"]
-        print(f"KB status: {status}")
-        if status == "ACTIVE":
-            print("Knowledge Base is ACTIVE")
-            break
-        elif status == "FAILED":
+        if status == "FAILED":
             raise Exception("Knowledge Base creation FAILED.")
-        time.sleep(5)
+        return status
+
+    poll_until(kb_status, lambda status: status == "ACTIVE", what="Knowledge Base to become ACTIVE")
+    logger.info("Knowledge Base is ACTIVE")
 
 def create_data_source(kb_id):
-    print("Adding S3 data source...")
+    logger.info("Adding S3 data source...")
     response = bedrock.create_data_source(
         knowledgeBaseId=kb_id,
         name="s3-data",
@@ -261,69 +366,69 @@ def create_data_source(kb_id):
         }
     )
     data_source_id = response["dataSource"]["dataSourceId"]
-    print("Data source added:", data_source_id)
+    logger.info("Data source added: %s", data_source_id)
     return data_source_id
-def start_ingestion(kb_id, data_source_id):
-    print(" Starting ingestion...")
+def start_ingestion(kb_id, data_source_id, stop=None):
+    logger.info(" Starting ingestion...")
     response = bedrock.start_ingestion_job(
         knowledgeBaseId=kb_id,
         dataSourceId=data_source_id
     )
     job_id = response["ingestionJob"]["ingestionJobId"]
-    print(" Ingestion job started:", job_id)
+    logger.info(" Ingestion job started: %s", job_id)
 
-    while True:
-        status = bedrock.get_ingestion_job(
+    def ingestion_job():
+        return bedrock.get_ingestion_job(
             knowledgeBaseId=kb_id,
             dataSourceId=data_source_id,
             ingestionJobId=job_id
         )
-        state = status["ingestionJob"]["status"]
-        print(" Ingestion status:", state)
-        if state in ["COMPLETE", "FAILED"]:
-            break
-        time.sleep(10)
+
+    # Ingestion runs for minutes, so start slower than the other waits
+    status = poll_until(ingestion_job, lambda s: s["ingestionJob"]["status"] in ["COMPLETE", "FAILED"],
+                        initial=5.0, timeout=3600, what=f"ingestion job {job_id}",
+                        describe=lambda s: s["ingestionJob"]["status"], stop=stop)
+    state = status["ingestionJob"]["status"]
 
     if state == "COMPLETE":
-        print(" Ingestion complete.")
-        print(" Checking for failure reasons (if any):")
-        print(status["ingestionJob"].get("failureReasons", []))
+        logger.info(" Ingestion complete.")
+        logger.info(" Checking for failure reasons (if any):")
+        logger.info("%s", status["ingestionJob"].get("failureReasons", []))
         
         
-        print(" Retrieving a few chunks from the knowledge base...")
-        runtime = boto3.client("bedrock-agent-runtime", region_name="us-east-1")
+        logger.info(" Retrieving a few chunks from the knowledge base...")
 
         try:
             retrieve_response = runtime.retrieve(
                 knowledgeBaseId=kb_id,
-                retrievalQuery={"text": "What is this document about?"}
+                retrievalQuery={"text": "What is this document about?"},
+                retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": 5}}
             )
             chunks = retrieve_response.get("retrievalResults", [])
-            print(f" Retrieved {len(chunks)} chunks.\n")
+            logger.info(" Retrieved %s chunks.\n", len(chunks))
 
-            for i, chunk in enumerate(chunks[:5], 1):  
+            for i, chunk in enumerate(chunks, 1):
                 text = chunk.get("content", {}).get("text", "")[:300]
                 metadata = chunk.get("content", {}).get("metadata", {})
-                print(f" Chunk {i}:")
-                print(f"   Text: {text.strip()}")
-                print(f"   Metadata: {json.dumps(metadata, indent=2)}\n")
+                logger.info(" Chunk %s:", i)
+                logger.info("   Text: %s", text.strip())
+                logger.info("   Metadata: %s\n", _dumps_bytes(metadata).decode())
         except Exception as e:
-            print("Error while retrieving chunks:", str(e))
+            logger.error("Error while retrieving chunks: %s", str(e))
 
     else:
-        print("Ingestion failed.")
-        print("Failure reasons:")
-        print(status["ingestionJob"].get("failureReasons", []))
+        logger.error("Ingestion failed.")
+        logger.error("Failure reasons:")
+        logger.error("%s", status["ingestionJob"].get("failureReasons", []))
         raise Exception("Ingestion failed.")
 
 
 def enable_code_interpreter(agent_id):
-    print("Enabling Code Interpreter and User Input action groups...")
-    action_group_client = boto3.client("bedrock-agent", region_name="us-east-1")
+    logger.info("Enabling Code Interpreter and User Input action groups...")
 
     def create_action_group(signature, name):
         try:
-            response = action_group_client.create_agent_action_group(
+            response = bedrock.create_agent_action_group(
                 actionGroupName=name,
                 actionGroupState="ENABLED",
                 agentId=agent_id,
@@ -333,7 +438,7 @@ def enable_code_interpreter(agent_id):
             return response["agentActionGroup"]["actionGroupId"]
         except botocore.exceptions.ClientError as e:
             if "ConflictException" in str(e):
-                print(f"Action group '{name}' already exists.")
+                logger.info("Action group '%s' already exists.", name)
                 return None
             else:
                 raise e
@@ -345,63 +450,44 @@ def enable_code_interpreter(agent_id):
     for ag_id, label in [(user_input_id, "UserInput"), (code_interp_id, "CodeInterpreter")]:
         if ag_id is None:
             continue
-        status = ""
-        print(f" Waiting for {label} action group to be ENABLED...")
-        while status != "ENABLED":
-            response = action_group_client.get_agent_action_group(
+        logger.info(" Waiting for %s action group to be ENABLED...", label)
+
+        def action_group_state(ag_id=ag_id, label=label):
+            response = bedrock.get_agent_action_group(
                 agentId=agent_id,
                 agentVersion="DRAFT",
                 actionGroupId=ag_id
             )
             status = response["agentActionGroup"]["actionGroupState"]
-            print(f"{label} status: {status}")
-            time.sleep(2)
-
-    print("Action groups ready. Preparing agent again...")
-    bedrock.prepare_agent(agentId=agent_id)
-    wait_for_agent_status(bedrock, agent_id, "PREPARED")
-    print("Agent re-prepared with action groups.")
+            return status
 
+        poll_until(action_group_state, lambda status: status == "ENABLED",
+                   what=f"{label} action group to be ENABLED")
 
-import boto3
-import time
+    logger.info("Action groups ready.")
 
-bedrock = boto3.client("bedrock-agent")
-print("create_agent_version" in dir(bedrock))  
-
-bedrock_runtime = boto3.client("bedrock-agent-runtime")
-import boto3
-import time
-import json
-
-bedrock = boto3.client("bedrock-agent")
 
 def create_agent(kb_id):
-    print("Creating agent...")
+    logger.info("Creating agent...")
     role_arn = "arn:aws:iam::406099943223:role/BedrockKBRole"
  
-    base_prompt_template = """You are an intelligent ETL Analyst. Your task is to analyze a SQL stored procedure and extract all column-level transformations involved in populating the source to target table. 
-
-Given a SQL stored procedure and data model metadata (including source tables, source schema, source data model, and target table), you must identify SELECT, INSERT, UPDATE, and JOIN operations relevant to those tables. 
-
-For each field in the target table, determine the source field(s), the transformation logic, and the transformation type (Direct Mapping, Expression, Lookup, or No Transformation). 
-
-Output a JSON array with sourceDataModel, sourceSchema, sourceTable, sourceFieldName, transformationLogic, transformationType, and targetFieldName. 
+    base_prompt_template = """You are an ETL analyst. Using the SQL stored procedure and data model metadata provided, trace the SELECT, INSERT, UPDATE and JOIN operations that populate each field of the target table.
 
-If multiple source fields are used, list them comma-separated. 
-If a field is hardcoded (e.g., CURRENT_TIMESTAMP()), use transformationType as 'Expression'. 
-If no mapping exists, set all source fields to 'No Mapping', transformationLogic to 'No Mapping', and transformationType to 'No Transformation'. 
+Return a JSON array with one object per target field, with keys: sourceDataModel, sourceSchema, sourceTable, sourceFieldName, transformationLogic, transformationType, targetFieldName.
+- transformationType is one of: Direct Mapping, Expression (including hardcoded values such as CURRENT_TIMESTAMP()), Lookup, No Transformation.
+- Multiple source fields are comma-separated.
+- Unmapped fields use 'No Mapping' for the source fields and transformationLogic, and 'No Transformation' as transformationType.
 
-Here is the user input: $question$
+User input: $question$
 
 $agent_scratchpad$"""
-    print(">>>>>>>>>> DEBUG BaseTemplate:>>>>>>>>>>> ", base_prompt_template)
+    logger.debug("Base prompt template: %s", base_prompt_template)
  
     response = bedrock.create_agent(
         agentName="genai-agent",
         agentResourceRoleArn=role_arn,
         # instruction=base_prompt_template["messages"][0]["content"],
-        instruction="You are a helpful assistant that answers questions using the knowledge base For questions about data transformations, respond with the source tables, target tables, and transformation logic in JSON format.",
+        instruction="Answer from the knowledge base. For data transformation questions, return the source tables, target tables and transformation logic as JSON.",
         description="ETL Analyst Agent for parsing SQL stored procedures",
         foundationModel="arn:aws:bedrock:us-east-1:406099943223:inference-profile/us.meta.llama4-maverick-17b-instruct-v1:0",
         idleSessionTTLInSeconds=600,
@@ -432,15 +518,12 @@ $agent_scratchpad$"""
     )
  
     agent_id = response["agent"]["agentId"]
-    print(f"Agent created: {agent_id}")
+    logger.info("Agent created: %s", agent_id)
     wait_for_agent_status(bedrock, agent_id, "NOT_PREPARED")
  
-    print("Preparing agent...")
-    bedrock.prepare_agent(agentId=agent_id)
-    wait_for_agent_status(bedrock, agent_id, "PREPARED")
-    print("Agent prepared.")
- 
-    print("Attaching Knowledge Base...")
+    # The KB and action groups are attached to the DRAFT version before the
+    # first prepare, so the agent is only built once
+    logger.info("Attaching Knowledge Base...")
     attach_response = bedrock.associate_agent_knowledge_base(
         agentId=agent_id,
         agentVersion="DRAFT",
@@ -448,229 +531,86 @@ $agent_scratchpad$"""
         knowledgeBaseState="ENABLED",
         description="Attach KB to agent"
     )
-    print(f"KB attached: {attach_response}")
+    logger.info("KB attached: %s", attach_response)
+
+    enable_code_interpreter(agent_id)
  
-    print("Re-preparing agent after KB attachment...")
+    logger.info("Preparing agent...")
     bedrock.prepare_agent(agentId=agent_id)
     wait_for_agent_status(bedrock, agent_id, "PREPARED")
-    print("Agent re-prepared.")
+    logger.info("Agent prepared.")
  
-    print("Creating alias 'prod' (auto-version)...")
+    logger.info("Creating alias 'prod' (auto-version)...")
     alias_response = bedrock.create_agent_alias(
         agentId=agent_id,
         agentAliasName='prod'
     )
     alias_id = alias_response['agentAlias']['agentAliasId']
-    print(f"Alias created: {alias_id}")
+    logger.info("Alias created: %s", alias_id)
     return agent_id, alias_id
 
-# def create_agent(kb_id):
-#     print("Creating agent...")
-#     role_arn = "arn:aws:iam::406099943223:role/BedrockKBRole"
-#     instruction = """
-# You are an intelligent ETL Analyst. Your task is to analyze a SQL stored procedures and extract all column-level transformations involved in populating the source to target table.
- 
-# Given:
-# - A SQL Stored Procedure
-# - Below is the Data Model Metadata specifying source tables, source schema, source data model, and the target table:
-#  **Data model metadata**, [
-#            {
-#              "sourceDataModel": "Datamodel_SOURCE_ISU Training _PA_TABLES",
-#              "dataSourceType": "Snowflake",
-#              "sourceSchema": "TESTDB.DG",
-#              "sourceTables": [
-#                "MISC_ISU_PA_CPNT_COMPLIANCE_DATA",
-#                "MISC_ISU_PA_CBT_STUD_CPNT_MOD",
-#                "MISC_ISU_PA_STUD_CPNT",
-#                "MISC_ISU_PA_CPNT",
-#                "MISC_ISU_PA_CMPL_STAT",
-#                "MISC_ISU_PA_ENROLL_SEAT",
-#                "MISC_ISU_PA_QUAL",
-#                "MISC_ISU_PA_CPNT_EVTHST",
-#                "MISC_ISU_PA_STUD_QUAL_CPNT",
-#                "MISC_ISU_PA_CBT_STUD_CPNT"
-#              ],
-#              "targetTable": "EDW_STAGE_ISUTRAINING"
-#            }
-#          ]
- 
-# Your goal is to:
-# 1. Parse the stored procedure and identify all SELECT, INSERT, UPDATE, and JOIN operations relevant to the specified source and target tables.
-# 2. For each field in the target table, determine:
-#    - The source field(s) it comes from
-#    - The transformation logic applied (if any)
-#    - The type of transformation: "Direct Mapping", "Expression", "Lookup", or "No Transformation"
-# 3. Output a JSON array containing transformation details for each field.
- 
-# The output must strictly follow this format:
-# ```json
-# [
-#   {
-#     "sourceDataModel": "string",
-#     "sourceSchema": "string",
-#     "sourceTable": "string",
-#     "sourceFieldName": "string",
-#     "transformationLogic": "string",
-#     "transformationType": "Direct Mapping | Expression | Lookup | No Transformation",
-#     "targetFieldName": "string"
-#   }
-# ]
-# Rules:
-#     - Source field name whould be column name from source table, dont add alias names or transformation logic in sourceFieldName.
-#     - If we have multiple columns involved from source tables, add multiple columns with comma seperator in sourceFieldName.
-#     - For each target column name get the valid transformationLogic and transformationType from the given source tables.
-#   - Only include fields used in the final transformation to the target table.
-#   - If a field is derived via expressions (e.g., concatenation, CASE statements, calculations), mark transformationType as "Expression" and provide the full expression in transformationLogic.
-#   - If a field is retrieved via a lookup/join to another table not listed in the provided sources, mark transformationType as "Lookup".
-#   - If a field is directly mapped without any manipulation, mark transformationType as "Direct Mapping" and set transformationLogic to "DIRECT".
-#   - If a field is hardcoded or defaulted (e.g., CURRENT_TIMESTAMP()), mark transformationType as "Expression" and specify the value in transformationLogic.
- 
-# 🚫 *** Important Rule for Unmapped source to target Columns**:
- 
-# -   If no source column, table, or transformation logic is found for a target column, then:
-# -   Set "transformationLogic": "No Mapping"
-# -   And for "sourceDataModel", "sourceSchema", "sourceTable", and "sourceFieldName", set them to "No Mapping" as well.
-# -   Use "transformationType": "No Transformation"
-# """
-#     response = bedrock.create_agent(
-#         agentName="genai-agent",
-#         # foundationModel="anthropic.claude-3-haiku-20240307-v1:0",
-#         foundationModel="anthropic.claude-3-5-sonnet-20240620-v1:0",
-#         # foundationModel="arn:aws:bedrock:us-east-1:406099943223:inference-profile/us.anthropic.claude-3-5-haiku-20241022-v1:0",
-#         # foundationModel="arn:aws:bedrock:us-east-1::foundation-model/anthropic.claude-3-5-haiku-20241022-v1:0",
-#         instruction=instruction,
-#         agentResourceRoleArn=role_arn,
-#         idleSessionTTLInSeconds=600,
-#         memoryConfiguration={ 
-#         "enabledMemoryTypes": ["SESSION_SUMMARY"],
-#         "sessionSummaryConfiguration": {
-#         "maxRecentSessions": 3
-#         },
-#         "storageDays": 1
-#         }
-#     )
-#     agent_id = response["agent"]["agentId"]
-#     print(f"Agent created: {agent_id}")
+def wait_for_index_ready(collection_arn, index_name, timeout=120, initial=1.0):
+    logger.info(" Waiting for index '%s' to become available...", index_name)
 
-    
-#     wait_for_agent_status(bedrock, agent_id, "NOT_PREPARED")
+    endpoint, col_region = _endpoint_for(collection_arn)
+    url = f"{endpoint}/_cat/indices/{index_name}?format=json"
+    aws_auth = _get_auth(col_region)
 
-    
-#     print("Preparing agent...")
-#     bedrock.prepare_agent(agentId=agent_id)
-#     wait_for_agent_status(bedrock, agent_id, "PREPARED")
-#     print("Agent prepared.")
-
-    
-#     print(" Attaching Knowledge Base...")
-#     attach_response = bedrock.associate_agent_knowledge_base(
-#         agentId=agent_id,
-#         agentVersion="DRAFT",
-#         knowledgeBaseId=kb_id,
-#         knowledgeBaseState="ENABLED",  
-#         description="Attach KB to agent"
-#     )
-#     print(f" KB attached: {attach_response}")
-
-    
-#     print("Re-preparing agent after KB attachment...")
-#     bedrock.prepare_agent(agentId=agent_id)
-#     wait_for_agent_status(bedrock, agent_id, "PREPARED")
-#     print("Agent re-prepared.")
-
-    
-#     print("Creating alias 'prod' (auto-version)...")
-#     alias_response = bedrock.create_agent_alias(
-#         agentId=agent_id,
-#         agentAliasName='prod'
-#     )
-#     alias_id = alias_response['agentAlias']['agentAliasId']
-#     print(f"Alias created: {alias_id}")
-
-#     return agent_id, alias_id
-
-def wait_for_index_ready(collection_arn, index_name, timeout=120, interval=5):
-    print(f" Waiting for index '{index_name}' to become available...")
-
-    parts = collection_arn.split(":")
-    region = parts[3]
-    endpoint_name = collection_arn.split("/")[-1]
-    endpoint = f"{endpoint_name}.{region}.aoss.amazonaws.com"
-
-    url = f"https://{endpoint}/_cat/indices/{index_name}?format=json"
-    session = boto3.Session()
-    credentials = session.get_credentials().get_frozen_credentials()
-    aws_auth = AWS4Auth(
-        credentials.access_key,
-        credentials.secret_key,
-        region,
-        "aoss",
-        session_token=credentials.token
-    )
-
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        response = requests.get(url, auth=aws_auth)
+    def index_available():
+        response = http.get(url, auth=aws_auth)
         if response.status_code == 200:
             try:
                 index_info = response.json()
                 if any(idx.get("index") == index_name for idx in index_info):
-                    print(" Index is now available.")
-                    return
+                    return True
             except Exception:
                 pass
-        print(f" Index not ready (status {response.status_code}). Retrying...")
-        time.sleep(interval)
+        return False
 
-    raise TimeoutError(f" Index '{index_name}' did not become available within {timeout} seconds.")
+    poll_until(index_available, bool, initial=initial, timeout=timeout,
+               what=f"index '{index_name}' to become available",
+               describe=lambda ready: "available" if ready else "not ready")
+    logger.info(" Index is now available.")
 
 
 
 
 def wait_for_alias_ready(agent_id, alias_id, timeout=600):
-    print("Waiting for agent alias to become READY or PREPARED...")
-    start_time = time.time()
-    while True:
+    logger.info("Waiting for agent alias to become READY or PREPARED...")
+
+    def alias_status():
         response = bedrock.get_agent_alias(agentId=agent_id, agentAliasId=alias_id)
         status = response["agentAlias"]["agentAliasStatus"]
-        print(f"Alias status: {status}")
-        if status in ["READY", "PREPARED"]:  
-            print(f"Agent alias is {status}.")
-            break
-        elif status == "FAILED":
+        if status == "FAILED":
             raise Exception("Alias creation failed.")
-        elif time.time() - start_time > timeout:
-            raise TimeoutError("Timeout waiting for alias to become READY.")
-        time.sleep(5)
+        return status
 
-import time
+    status = poll_until(alias_status, lambda status: status in ["READY", "PREPARED"], timeout=timeout,
+                        what="alias to become READY")
+    logger.info("Agent alias is %s.", status)
 
 
-def wait_for_agent_status(bedrock_client, agent_id, expected_status, max_retries=60, interval=5):
-    print(f"Waiting for agent {agent_id} to reach status: {expected_status}")
-    
-    for attempt in range(max_retries):
+def wait_for_agent_status(bedrock_client, agent_id, expected_status, timeout=300):
+    logger.info("Waiting for agent %s to reach status: %s", agent_id, expected_status)
+
+    def agent_status():
         try:
             response = bedrock_client.get_agent(agentId=agent_id)
             current_status = response.get("agent", {}).get("agentStatus", "UNKNOWN")
         except Exception as e:
             current_status = "UNKNOWN"
 
-        print(f"Agent status: {current_status}")
-
-        if current_status == expected_status:
-            print(f"Agent reached status: {expected_status}")
-            return
-        elif current_status in ["FAILED", "DELETING", "DELETED"]:
+        if current_status in ["FAILED", "DELETING", "DELETED"]:
             raise Exception(f"Agent reached terminal state: {current_status}")
-        
-        time.sleep(interval)
+        return current_status
 
-    raise TimeoutError(f"Agent did not reach '{expected_status}' status within {max_retries * interval} seconds.")
+    poll_until(agent_status, lambda status: status == expected_status, timeout=timeout,
+               what=f"agent to reach '{expected_status}' status")
+    logger.info("Agent reached status: %s", expected_status)
 
 
 def attach_kb_to_agent(agent_id, kb_id):
-    print("Linking Knowledge Base to Agent...")
+    logger.info("Linking Knowledge Base to Agent...")
 
     bedrock.associate_agent_knowledge_base(
         agentId=agent_id,
@@ -680,7 +620,7 @@ def attach_kb_to_agent(agent_id, kb_id):
         description="Linking KB to agent"
     )
 
-    print("Knowledge base successfully linked.")
+    logger.info("Knowledge base successfully linked.")
 
 # def invoke_agent(agent_id, alias_id, question):
 #     print(f"Asking agent: {question}")
@@ -705,38 +645,38 @@ def attach_kb_to_agent(agent_id, kb_id):
 #     return full_response
 
 def invoke_agent(agent_id, alias_id, question):
-    import uuid
-    import boto3
-    import json
-    import botocore.exceptions
- 
-    print(f"Asking agent: {question}")
+    logger.info("Asking agent: %s", question)
     session_id = str(uuid.uuid4())
-    runtime = boto3.client("bedrock-agent-runtime", region_name="us-east-1")
- 
+
     try:
         response = runtime.invoke_agent(
             agentId=agent_id,
             agentAliasId=alias_id,
             sessionId=session_id,
-            inputText=question
+            inputText=question,
+            # Stream the final answer as it is generated
+            streamingConfigurations={"streamFinalResponse": True}
         )
  
-        print("Raw response:", response)
+        logger.debug("Raw response: %s", response)
  
         # Handle streaming response
         if "completion" in response:
-            full_response = ""
+            print("\nAgent Response:\n")
+            # The incremental decoder holds back a multi-byte character split
+            # across two chunks; its output is both printed and kept for the answer
+            parts = []
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
             for event in response["completion"]:
                 chunk_bytes = event.get("chunk", {}).get("bytes")
                 if chunk_bytes:
-                    try:
-                        full_response += chunk_bytes.decode("utf-8", errors="replace")
-                    except Exception as decode_err:
-                        print(f"⚠️ Error decoding chunk: {decode_err}")
-            print("\nAgent Response:\n")
-            print(full_response.strip())
-            return full_response.strip()
+                    text = decoder.decode(chunk_bytes)
+                    parts.append(text)
+                    print(text, end="", flush=True)
+            text = decoder.decode(b"", final=True)
+            parts.append(text)
+            print(text)
+            return "".join(parts).strip()
  
         # Handle non-streaming fallback
         elif "completionResponse" in response:
@@ -746,33 +686,100 @@ def invoke_agent(agent_id, alias_id, question):
             return output.strip()
  
         else:
-            print("⚠️ Unexpected response structure:")
-            print(json.dumps(response, indent=2))
+            logger.warning("⚠️ Unexpected response structure:")
+            logger.warning("%s", json.dumps(response, indent=2))
             return ""
  
     except botocore.exceptions.EventStreamError as e:
-        print("❌ Stream error:", str(e))
+        logger.error("❌ Stream error: %s", str(e))
         if hasattr(e, "error_response"):
-            print("Error details:")
-            print(json.dumps(e.error_response, indent=2))
+            logger.error("Error details:")
+            logger.error("%s", json.dumps(e.error_response, indent=2))
         return ""
  
     except Exception as e:
-        print("❌ General error:", str(e))
+        logger.error("❌ General error: %s", str(e))
         return ""
 
 
+async def invoke_agent_async(client, agent_id, alias_id, question):
+    """Ask the agent one question on an aioboto3 bedrock-agent-runtime client and return the full answer."""
+    response = await client.invoke_agent(
+        agentId=agent_id,
+        agentAliasId=alias_id,
+        sessionId=str(uuid.uuid4()),
+        inputText=question,
+        streamingConfigurations={"streamFinalResponse": True}
+    )
+    parts = []
+    async for event in response["completion"]:
+        chunk_bytes = event.get("chunk", {}).get("bytes")
+        if chunk_bytes:
+            parts.append(chunk_bytes)
+    return b"".join(parts).decode("utf-8", errors="replace").strip()
+
+
+def _is_throttled(error):
+    # EventStreamError reports mid-stream throttling as "throttlingException"
+    return error.response.get("Error", {}).get("Code", "").lower() == "throttlingexception"
+
+
+def run_many(agent_id, alias_id, questions, concurrency=4, max_retries=5):
+    """Ask several questions concurrently on one event loop and return the answers in order.
+
+    At most `concurrency` invocations are in flight, to stay inside the Bedrock TPS quota and
+    the shared client_config's connection pool, and throttled invocations are retried with
+    exponential backoff.
+    """
+    # Imported on demand: aioboto3 pulls in aiohttp, which the synchronous path never needs
+    import aioboto3
+
+    async def ask(client, semaphore, question):
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                try:
+                    return await invoke_agent_async(client, agent_id, alias_id, question)
+                except botocore.exceptions.ClientError as e:
+                    if not _is_throttled(e) or attempt == max_retries:
+                        raise
+                    delay = min(30.0, 2 ** attempt)
+                    logger.warning("⚠️ Throttled, retrying in %.1fs: %s", delay, question)
+                    await asyncio.sleep(delay + random.uniform(0, 0.3 * delay))
+
+    # Same profile and region as the module session; 'default' is left implicit so
+    # environment credentials still apply
+    profile_name = None if session.profile_name == "default" else session.profile_name
+    async_session = aioboto3.Session(profile_name=profile_name, region_name=session.region_name)
+
+    async def ask_all():
+        semaphore = asyncio.Semaphore(min(concurrency, client_config.max_pool_connections))
+        async with async_session.client("bedrock-agent-runtime", config=client_config) as client:
+            return await asyncio.gather(*(ask(client, semaphore, question) for question in questions))
+
+    return asyncio.run(ask_all())
+
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     ensure_opensearch_policies()
     collection_arn = create_collection(collection_name)
-    wait_for_index_ready(collection_arn, "genai-index")  
-    time.sleep(30)
+    wait_for_index_ready(collection_arn, "genai-index")
     kb_id = create_knowledge_base(collection_arn)
     wait_for_kb_active(kb_id)
     data_source_id = create_data_source(kb_id)
-    start_ingestion(kb_id, data_source_id)
-    agent_id, alias_id = create_agent(kb_id)
-    enable_code_interpreter(agent_id)
+    # Ingestion is the long pole and the agent only needs the KB id, so build
+    # the agent while ingestion runs in the background
+    stop_ingestion = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        ingestion = executor.submit(start_ingestion, kb_id, data_source_id, stop_ingestion)
+        try:
+            agent_id, alias_id = create_agent(kb_id)
+        except Exception:
+            # Don't sit through up to an hour of ingestion polling before the error surfaces
+            logger.exception("Agent setup failed, stopping the ingestion poll")
+            stop_ingestion.set()
+            raise
+        ingestion.result()
     wait_for_alias_ready(agent_id, alias_id)
     invoke_agent(agent_id, alias_id, "List the etl mappings for the target coloumn")
 